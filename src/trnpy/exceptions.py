@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Any, Callable, Optional, Tuple, Type
 
 
 class UnsupportedOperatingSystem(Exception):
@@ -12,6 +12,10 @@ class DuplicateLibraryError(Exception):
     """Raised when a library file has already been loaded."""
 
 
+class ThreadAffinityError(Exception):
+    """Raised when a simulation is used from a thread other than its owner."""
+
+
 class SimulationError(Exception):
     """Raised when a simulation reports a fatal error."""
 
@@ -25,6 +29,10 @@ class TrnsysError(Exception):
         )
         self.error_code = error_code
 
+    def __reduce__(self) -> Tuple[Callable[..., "TrnsysError"], Tuple[Any, ...]]:
+        """Support pickling, e.g., when raised in a worker process."""
+        return (_restore_trnsys_error, (type(self), self.error_code, str(self)))
+
 
 class TrnsysInitializeSimulationError(TrnsysError):
     def __init__(self, error_code: int):
@@ -66,3 +74,13 @@ class TrnsysSetInputValueError(TrnsysError):
             2: "input number is not valid for this unit",
         }
         super().__init__(error_code, messages.get(error_code))
+
+
+def _restore_trnsys_error(
+    cls: Type[TrnsysError], error_code: int, message: str
+) -> TrnsysError:
+    """Recreate a pickled `TrnsysError` without calling its `__init__`."""
+    error = cls.__new__(cls)
+    Exception.__init__(error, message)
+    error.error_code = error_code
+    return error
@@ -1,3 +1,25 @@
+from .batch import BatchJob, BatchResult, JobFailure, run_batch
+from .dispatch import SimulationDispatcher
+from .ensemble import Ensemble
+from .memo import MemoizedSimulation, StepCache
+from .playback import InputPlayback
+from .results import Results, ResultsWriter
 from .simulation import Simulation
+from .validate import DeckValidation, DeckValidator
 
-__all__ = ["Simulation"]
+__all__ = [
+    "BatchJob",
+    "BatchResult",
+    "DeckValidation",
+    "DeckValidator",
+    "Ensemble",
+    "InputPlayback",
+    "JobFailure",
+    "MemoizedSimulation",
+    "Results",
+    "ResultsWriter",
+    "Simulation",
+    "SimulationDispatcher",
+    "StepCache",
+    "run_batch",
+]
@@ -0,0 +1,256 @@
+"""Code related to running batches of TRNSYS simulations."""
+
+from __future__ import annotations
+
+import functools
+import multiprocessing
+import os
+from collections import Counter, deque
+from multiprocessing.connection import Connection, wait
+from multiprocessing.context import BaseContext
+from multiprocessing.process import BaseProcess
+from pathlib import Path
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from ..exceptions import TrnsysError
+from .results import ResultsWriter
+from .simulation import Simulation
+
+
+class BatchJob(NamedTuple):
+    """A simulation to run as part of a batch.
+
+    Attributes:
+        name (str): Identifies the job in the batch results.
+        factory (Callable[[], Simulation]): Creates the simulation in a worker
+            process.  Must be picklable unless a "fork" context is used.
+        results_dir (Optional[Path]): If provided, the stored values of every
+            step are written here using a `ResultsWriter`.
+    """
+
+    name: str
+    factory: Callable[[], Simulation]
+    results_dir: Optional[Path] = None
+
+    @classmethod
+    def from_deck(
+        cls,
+        name: str,
+        trnsys_dir: Union[str, Path],
+        input_file: Union[str, Path],
+        user_type_libs: Optional[List[Union[str, Path]]] = None,
+        *,
+        results_dir: Optional[Union[str, Path]] = None,
+    ) -> BatchJob:
+        """Create a job that runs a deck with `Simulation.new`.
+
+        Refer to the documentation of `Simulation.new` for details on the
+        arguments.
+        """
+        factory = functools.partial(
+            Simulation.new, trnsys_dir, input_file, user_type_libs
+        )
+        return cls(name, factory, None if results_dir is None else Path(results_dir))
+
+
+class JobFailure(NamedTuple):
+    """A structured record of a failed job.
+
+    Attributes:
+        job (str): The name of the job.
+        step (Optional[int]): The current step of the simulation when it
+            failed, or None if the simulation was never created.
+        time (Optional[float]): The current time of the simulation when it
+            failed, or None if the simulation was never created.
+        error_type (str): The name of the exception raised, or "WorkerExited"
+            if the worker process exited without reporting a result.
+        error_code (Optional[int]): The TRNSYS error code, or the worker's exit
+            code for "WorkerExited".  None for other errors.
+        message (str): A description of the error.
+    """
+
+    job: str
+    step: Optional[int]
+    time: Optional[float]
+    error_type: str
+    error_code: Optional[int]
+    message: str
+
+
+class BatchResult(NamedTuple):
+    """The return value of `run_batch`.
+
+    Attributes:
+        completed (List[str]): The names of jobs that ran to their final time.
+        failures (List[JobFailure]): A record of each job that failed.
+        skipped (List[str]): The names of jobs that did not finish because
+            the batch was aborted.
+        aborted (bool): True if the batch was aborted early.
+    """
+
+    completed: List[str]
+    failures: List[JobFailure]
+    skipped: List[str]
+    aborted: bool
+
+
+def run_batch(
+    jobs: Iterable[BatchJob],
+    *,
+    processes: Optional[int] = None,
+    max_failures_per_code: Optional[int] = None,
+    mp_context: Optional[BaseContext] = None,
+) -> BatchResult:
+    """Run a batch of simulations in parallel, capturing any failures.
+
+    Each job runs in a fresh worker process, since a TRNSYS library can only
+    back one simulation per process.  A job that raises an error, or whose
+    worker crashes, is recorded as a `JobFailure` and does not affect the
+    other jobs.
+
+    Usage example:
+        jobs = [
+            BatchJob.from_deck(deck.stem, trnsys_dir, deck, results_dir=deck.stem)
+            for deck in decks
+        ]
+        result = run_batch(jobs, max_failures_per_code=10)
+        for failure in result.failures:
+            print(f"{failure.job} failed at {failure.time}: {failure.message}")
+
+    Args:
+        jobs: The jobs to run.
+        processes (int, optional): The maximum number of jobs running at once.
+            Defaults to the number of CPUs.
+        max_failures_per_code (int, optional): If provided, the batch is
+            aborted once this many jobs fail with the same error type and
+            code.  Jobs that are running when the batch is aborted are
+            terminated.
+        mp_context (optional): The multiprocessing context used to start
+            workers.  Defaults to the "spawn" context.
+
+    Returns:
+        BatchResult
+
+    Raises:
+        ValueError: If `processes` or `max_failures_per_code` is less than 1.
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes < 1:
+        raise ValueError("Number of processes cannot be less than 1.")
+    if max_failures_per_code is not None and max_failures_per_code < 1:
+        raise ValueError("Maximum failures per code cannot be less than 1.")
+
+    context = mp_context or multiprocessing.get_context("spawn")
+    jobs = list(jobs)
+    pending: Deque[int] = deque(range(len(jobs)))
+    running: Dict[Connection, Tuple[int, BaseProcess]] = {}
+    outcomes: Dict[int, Optional[JobFailure]] = {}
+    failure_counts: Counter[Tuple[str, Optional[int]]] = Counter()
+    aborted = False
+
+    try:
+        while (pending or running) and not aborted:
+            while pending and len(running) < processes:
+                index = pending.popleft()
+                (parent_conn, child_conn) = context.Pipe(duplex=False)
+                process = context.Process(  # type: ignore[attr-defined]
+                    target=_run_job, args=(child_conn, jobs[index]), daemon=True
+                )
+                process.start()
+                child_conn.close()
+                running[parent_conn] = (index, process)
+
+            for conn in wait(list(running)):
+                assert isinstance(conn, Connection)
+                (index, process) = running.pop(conn)
+                failure = _receive_outcome(conn, process, jobs[index])
+                outcomes[index] = failure
+                if failure is not None:
+                    key = (failure.error_type, failure.error_code)
+                    failure_counts[key] += 1
+                    if max_failures_per_code is not None:
+                        aborted |= failure_counts[key] >= max_failures_per_code
+    finally:
+        for conn, (_, process) in running.items():
+            process.terminate()
+            process.join()
+            conn.close()
+
+    completed = []
+    failures = []
+    skipped = []
+    for index, job in enumerate(jobs):
+        if index not in outcomes:
+            skipped.append(job.name)
+            continue
+        failure = outcomes[index]
+        if failure is None:
+            completed.append(job.name)
+        else:
+            failures.append(failure)
+    return BatchResult(completed, failures, skipped, aborted)
+
+
+def _receive_outcome(
+    conn: Connection, process: BaseProcess, job: BatchJob
+) -> Optional[JobFailure]:
+    """Receive the outcome of a job and wait for its worker to exit."""
+    try:
+        failure: Optional[JobFailure] = conn.recv()
+    except EOFError:
+        process.join()
+        failure = JobFailure(
+            job.name,
+            None,
+            None,
+            "WorkerExited",
+            process.exitcode,
+            f"The worker process exited unexpectedly ({process.exitcode}).",
+        )
+    process.join()
+    conn.close()
+    return failure
+
+
+def _run_job(conn: Connection, job: BatchJob) -> None:
+    """Run a job to its final time, sending None or a `JobFailure` when done."""
+    sim: Optional[Simulation] = None
+    try:
+        sim = job.factory()
+        done = False
+        if job.results_dir is None:
+            while not done:
+                done = sim.step_forward()
+        else:
+            with ResultsWriter.create(job.results_dir, sim) as writer:
+                while not done:
+                    done = writer.step_forward(sim)
+    except Exception as err:
+        (step, time) = (None, None) if sim is None else _sim_progress(sim)
+        error_code = err.error_code if isinstance(err, TrnsysError) else None
+        conn.send(
+            JobFailure(job.name, step, time, type(err).__name__, error_code, str(err))
+        )
+    else:
+        conn.send(None)
+    finally:
+        conn.close()
+
+
+def _sim_progress(sim: Simulation) -> Tuple[Optional[int], Optional[float]]:
+    """Return the current step and time of a simulation, if available."""
+    try:
+        return (sim.current_step, sim.current_time)
+    except Exception:
+        return (None, None)
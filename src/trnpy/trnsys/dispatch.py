@@ -0,0 +1,104 @@
+"""Code related to sharing a TRNSYS simulation between threads."""
+
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from .simulation import Simulation, StepForwardWithValuesReturn
+
+T = TypeVar("T")
+
+
+class SimulationDispatcher:
+    """Runs a simulation on its own thread on behalf of other threads.
+
+    The simulation is created by, bound to, and only ever used from a single
+    dispatcher thread.  Any thread can submit calls, which are run one at a
+    time in the order they were submitted.  Because ctypes releases the GIL
+    while TRNSYS is stepping forward, other Python threads keep running, so
+    post-processing results can overlap with simulation.
+
+    Usage example:
+        factory = functools.partial(Simulation.new, trnsys_dir, input_file)
+        with SimulationDispatcher(factory) as dispatcher:
+            future = dispatcher.step_forward_with_values(24)
+            ...  # do other work while the simulation steps forward
+            (values, done) = future.result()
+    """
+
+    def __init__(self, factory: Callable[[], Simulation]):
+        """Initialize a SimulationDispatcher object.
+
+        Errors raised by `factory` are re-raised.
+
+        Args:
+            factory: Creates the simulation on the dispatcher thread.
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="trnpy-simulation"
+        )
+        try:
+            self._sim = self._executor.submit(_create_bound, factory).result()
+        except BaseException:
+            self._executor.shutdown()
+            raise
+
+    def __enter__(self) -> SimulationDispatcher:
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        """Exit the runtime context, closing the dispatcher."""
+        self.close()
+
+    def close(self) -> None:
+        """Wait for submitted calls to finish and stop the dispatcher thread."""
+        self._executor.shutdown(wait=True)
+
+    def submit(self, fn: Callable[[Simulation], T]) -> Future[T]:
+        """Schedule a call that uses the simulation on the dispatcher thread.
+
+        The call must not wait on another call to this dispatcher, since calls
+        run one at a time.
+
+        Args:
+            fn: Called with the simulation as its only argument.
+
+        Returns:
+            Future: Resolves to the return value of `fn`, or its error.
+        """
+        return self._executor.submit(fn, self._sim)
+
+    def step_forward(self, steps: int = 1) -> Future[bool]:
+        """Schedule a call to `Simulation.step_forward`."""
+        return self.submit(lambda sim: sim.step_forward(steps))
+
+    def step_forward_with_values(
+        self, steps: int = 1
+    ) -> Future[StepForwardWithValuesReturn]:
+        """Schedule a call to `Simulation.step_forward_with_values`."""
+        return self.submit(lambda sim: sim.step_forward_with_values(steps))
+
+    def get_output_value(self, *, unit: int, output_number: int) -> Future[float]:
+        """Schedule a call to `Simulation.get_output_value`."""
+        return self.submit(
+            lambda sim: sim.get_output_value(unit=unit, output_number=output_number)
+        )
+
+    def set_input_value(
+        self, *, unit: int, input_number: int, value: float
+    ) -> Future[None]:
+        """Schedule a call to `Simulation.set_input_value`."""
+        return self.submit(
+            lambda sim: sim.set_input_value(
+                unit=unit, input_number=input_number, value=value
+            )
+        )
+
+
+def _create_bound(factory: Callable[[], Simulation]) -> Simulation:
+    """Create a simulation that is bound to the current thread."""
+    sim = factory()
+    sim.bind_to_current_thread()
+    return sim
@@ -0,0 +1,402 @@
+"""Code related to running an ensemble of TRNSYS simulations in lockstep."""
+
+from __future__ import annotations
+
+import functools
+import multiprocessing
+import os
+import time
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Connection
+from multiprocessing.context import BaseContext
+from multiprocessing.process import BaseProcess
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Any, Callable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from ..exceptions import SimulationError
+from .lib import StoredValueInfo
+from .simulation import Simulation
+
+_CLOSE_TIMEOUT = 10.0  # seconds to wait for workers before terminating them
+
+
+class EnsembleStepReturn(NamedTuple):
+    """The return value of `Ensemble.step_forward_with_values`.
+
+    Attributes:
+        values (memoryview): The stored values of every member after stepping
+            forward, with shape `(size, stored_values_count)`.
+        done (List[bool]): True for each member that has reached its final time.
+    """
+
+    values: memoryview[float]
+    done: List[bool]
+
+
+class Ensemble:
+    """Represents independent TRNSYS simulations stepped forward in lockstep.
+
+    Each member simulation is hosted by its own worker process, since a
+    TRNSYS library can only back one simulation per process.  Members step
+    forward concurrently and write their stored values directly into a
+    single shared memory block, which is exposed as a `(size,
+    stored_values_count)` view of float64 values.  The view can be wrapped
+    without copying (e.g., `numpy.asarray(ensemble.values)`) and is
+    overwritten each time the ensemble steps forward.
+
+    Usage example:
+        input_files = [f"path/to/member_{i}/example.dck" for i in range(8)]
+        with Ensemble.new(trnsys_dir, input_files) as ensemble:
+            ensemble.set_input_values([(7, 1), (7, 2)], member_inputs)
+            done = False
+            while not done:
+                (values, done_flags) = ensemble.step_forward_with_values()
+                done = all(done_flags)
+    """
+
+    @classmethod
+    def new(
+        cls,
+        trnsys_dir: Union[str, Path],
+        input_files: Sequence[Union[str, Path]],
+        user_type_libs: Optional[List[Union[str, Path]]] = None,
+        *,
+        mp_context: Optional[BaseContext] = None,
+    ) -> Ensemble:
+        """Create an ensemble with one member for each input file.
+
+        Members usually run copies of the same deck.  Each copy should be in
+        its own directory so that members do not overwrite each other's
+        output files.
+
+        Args:
+            trnsys_dir: Path to the TRNSYS directory.  Must exist.
+            input_files: Paths to each member's input (deck) file.  All must exist.
+            user_type_libs: Optional list of paths to user Type libs.  All must exist.
+            mp_context (optional): The multiprocessing context used to start
+                workers.  Defaults to the "spawn" context.
+
+        Raises:
+            FileNotFoundError: If any provided path does not exist.
+            ValueError: If the members do not have the same number of stored values.
+            TrnsysInitializeSimulationError: If a member's deck cannot be initialized.
+        """
+        trnsys_dir = Path(trnsys_dir).resolve(strict=True)
+        type_libs = [
+            Path(lib_file).resolve(strict=True) for lib_file in user_type_libs or []
+        ]
+        factories = [
+            functools.partial(
+                Simulation.new,
+                trnsys_dir,
+                Path(input_file).resolve(strict=True),
+                list(type_libs),
+            )
+            for input_file in input_files
+        ]
+        return cls(factories, mp_context=mp_context)
+
+    def __init__(
+        self,
+        factories: Sequence[Callable[[], Simulation]],
+        *,
+        mp_context: Optional[BaseContext] = None,
+    ):
+        """Initialize an Ensemble object.
+
+        Errors raised by a factory in a member's worker process are re-raised.
+
+        Args:
+            factories: Creates each member's simulation in its worker process.
+                Must be picklable unless a "fork" context is used.
+            mp_context (optional): The multiprocessing context used to start
+                workers.  Defaults to the "spawn" context.
+
+        Raises:
+            ValueError: If there are no factories, or if the members do not have
+                the same, nonzero, number of stored values.
+        """
+        if not factories:
+            raise ValueError("An ensemble must have at least one member.")
+
+        context = mp_context or multiprocessing.get_context("spawn")
+        if os.name == "posix":
+            # Workers must share this process's tracker, otherwise each one
+            # would start its own and unlink the shared memory when it exits
+            resource_tracker.ensure_running()
+        self.size = len(factories)
+        self._connections: List[Connection] = []
+        self._processes: List[BaseProcess] = []
+        self._shm: Optional[SharedMemory] = None
+        self._values: Optional[memoryview[float]] = None
+        self._broken: Optional[str] = None
+        try:
+            for factory in factories:
+                (parent_conn, child_conn) = context.Pipe()
+                process = context.Process(  # type: ignore[attr-defined]
+                    target=_serve, args=(child_conn, factory), daemon=True
+                )
+                process.start()
+                child_conn.close()
+                self._connections.append(parent_conn)
+                self._processes.append(process)
+
+            infos: List[List[StoredValueInfo]] = self._gather()
+            counts = {len(info) for info in infos}
+            if len(counts) != 1 or 0 in counts:
+                raise ValueError(
+                    "Ensemble members must have the same, nonzero, number of "
+                    f"stored values (found {sorted(counts)})."
+                )
+            self.stored_values_info = infos[0]
+            count = len(self.stored_values_info)
+
+            nbytes = self.size * count * 8
+            self._shm = SharedMemory(create=True, size=nbytes)
+            assert self._shm.buf is not None
+            self._values = self._shm.buf[:nbytes].cast("d", (self.size, count))
+            self._broadcast("attach", [(self._shm.name, i) for i in range(self.size)])
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self) -> Ensemble:
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        """Exit the runtime context, closing the ensemble."""
+        self.close()
+
+    def close(self) -> None:
+        """Stop the worker processes and release the shared memory.
+
+        Workers that do not exit within a few seconds are terminated.  Views
+        derived from `Ensemble.values` stay valid after the ensemble is
+        closed, and the shared memory is unmapped once the last one is
+        released.
+        """
+        for conn in self._connections:
+            try:
+                conn.send(("close", None))
+            except OSError:
+                pass  # the worker has already exited
+        deadline = time.monotonic() + _CLOSE_TIMEOUT
+        for process in self._processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for conn in self._connections:
+            conn.close()
+        self._connections = []
+        self._processes = []
+
+        if self._values is not None:
+            try:
+                self._values.release()
+            except BufferError:
+                pass  # released along with the views derived from it
+            self._values = None
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:
+                # Leave the mapping to the views still using it, which unmap
+                # it when released, and close the rest of the block
+                self._shm._mmap = None  # type: ignore[attr-defined]
+                self._shm.close()
+            finally:
+                self._shm.unlink()
+            self._shm = None
+
+    @property
+    def values(self) -> memoryview[float]:
+        """The stored values of every member after the most recent step.
+
+        This is a `(size, stored_values_count)` view of the shared memory
+        block that members write to.
+        """
+        if self._values is None:
+            raise ValueError("The ensemble has been closed.")
+        return self._values
+
+    def step_forward(self, steps: int = 1) -> List[bool]:
+        """Step every member forward.
+
+        Refer to the documentation of `Simulation.step_forward` for more details.
+
+        Returns:
+            List[bool]: True for each member that has reached its final time.
+        """
+        return self.step_forward_with_values(steps).done
+
+    def step_forward_with_values(self, steps: int = 1) -> EnsembleStepReturn:
+        """Step every member forward and return their stored values.
+
+        Refer to the documentation of `Simulation.step_forward_with_values`
+        for more details.
+
+        Returns:
+            EnsembleStepReturn: A named tuple with the following fields:
+                - values (memoryview): The `(size, stored_values_count)` view of
+                  stored values, which is overwritten by the next step.
+                - done (List[bool]): True for each member that has reached its
+                  final time.
+
+        Raises:
+            ValueError: If `steps` is less than 1.
+            TrnsysStepForwardError: If a member fails while stepping forward.
+            SimulationError: If a member exits unexpectedly.
+        """
+        if steps < 1:
+            raise ValueError("Number of steps cannot be less than 1.")
+
+        done: List[bool] = self._broadcast("step", [steps] * self.size)
+        return EnsembleStepReturn(self.values, done)
+
+    def set_input_values(
+        self,
+        targets: Sequence[Tuple[int, int]],
+        values: Sequence[Sequence[float]],
+    ) -> None:
+        """Set input values for every member.
+
+        Args:
+            targets: The `(unit, input_number)` pairs to set.
+            values: A `(size, len(targets))` array of values, where row `i` holds
+                the values for member `i` (e.g., a nested list or NumPy array).
+
+        Raises:
+            ValueError: If `values` does not have the expected shape.
+            TrnsysSetInputValueError: If a target is not valid.
+        """
+        targets = [(int(unit), int(input_number)) for (unit, input_number) in targets]
+        rows = [[float(value) for value in row] for row in values]
+        if len(rows) != self.size or any(len(row) != len(targets) for row in rows):
+            raise ValueError(
+                f"Expected values with shape ({self.size}, {len(targets)})."
+            )
+        self._broadcast("set_inputs", [(targets, row) for row in rows])
+
+    def get_output_values(self, *, unit: int, output_number: int) -> List[float]:
+        """Return the current output value of a unit for every member.
+
+        Args:
+            unit (int): The unit of interest.
+            output_number (int): The output of interest.
+
+        Raises:
+            TrnsysGetOutputValueError
+        """
+        return self._broadcast("get_output", [(unit, output_number)] * self.size)
+
+    def _broadcast(self, command: str, args: Sequence[Any]) -> List[Any]:
+        """Send a command to every member and wait for all replies.
+
+        Raises:
+            SimulationError: If the ensemble is broken because a member exited.
+        """
+        if self._broken is not None:
+            raise SimulationError(f"The ensemble is broken: {self._broken}")
+
+        exited = []
+        for index, (conn, arg) in enumerate(zip(self._connections, args)):
+            try:
+                conn.send((command, arg))
+            except OSError:
+                exited.append(index)
+        return self._gather(exited)
+
+    def _gather(self, exited: Optional[List[int]] = None) -> List[Any]:
+        """Wait for a reply from every member.
+
+        Replies are read from every member that is still running, even if
+        another member has exited or reported an error, so that every
+        connection stays in sync.  If a member has exited, the ensemble is
+        marked as broken.  Otherwise, the first error reported by a member is
+        raised.
+
+        Args:
+            exited (list, optional): Members already known to have exited.
+
+        Raises:
+            SimulationError: If a member exited without replying.
+        """
+        exited = list(exited or [])
+        replies: List[Any] = []
+        error: Optional[BaseException] = None
+        for index, conn in enumerate(self._connections):
+            if index in exited:
+                replies.append(None)
+                continue
+            try:
+                (ok, reply) = conn.recv()
+            except EOFError:
+                exited.append(index)
+                replies.append(None)
+                continue
+            if not ok and error is None:
+                error = reply
+            replies.append(reply)
+
+        if exited:
+            index = min(exited)
+            process = self._processes[index]
+            process.join()
+            self._broken = (
+                f"member {index} exited unexpectedly (exit code {process.exitcode})"
+            )
+            raise SimulationError(f"Ensemble {self._broken}.")
+        if error is not None:
+            raise error
+        return replies
+
+
+def _serve(conn: Connection, factory: Callable[[], Simulation]) -> None:
+    """Host a member simulation, executing commands sent by the ensemble."""
+    try:
+        sim = factory()
+    except Exception as err:
+        conn.send((False, err))
+        return
+    conn.send((True, sim.stored_values_info))
+
+    shm: Optional[SharedMemory] = None
+    row: Optional[memoryview] = None
+    try:
+        while True:
+            (command, arg) = conn.recv()
+            if command == "close":
+                break
+            try:
+                reply: Any = None
+                if command == "attach":
+                    (name, index) = arg
+                    count = sim.stored_values_count
+                    shm = SharedMemory(name=name)
+                    assert shm.buf is not None
+                    row = shm.buf[index * count * 8 : (index + 1) * count * 8]
+                elif command == "step":
+                    assert row is not None
+                    reply = sim.step_forward_into(row, arg)
+                elif command == "set_inputs":
+                    for (unit, input_number), value in zip(*arg):
+                        sim.set_input_value(
+                            unit=unit, input_number=input_number, value=value
+                        )
+                elif command == "get_output":
+                    (unit, output_number) = arg
+                    reply = sim.get_output_value(unit=unit, output_number=output_number)
+            except Exception as err:
+                conn.send((False, err))
+            else:
+                conn.send((True, reply))
+    except EOFError:
+        pass  # the ensemble has gone away
+    finally:
+        if row is not None:
+            row.release()
+        if shm is not None:
+            shm.close()
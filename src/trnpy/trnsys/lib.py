@@ -3,12 +3,16 @@
 import ctypes as ct
 import functools
 import json
+import mmap
 import platform
+import threading
+from array import array
 from pathlib import Path
-from typing import List, NamedTuple, Optional, Set
+from typing import Dict, List, NamedTuple, Optional, Set, Union
 
 from ..exceptions import (
     DuplicateLibraryError,
+    ThreadAffinityError,
     TrnsysInitializeSimulationError,
     UnsupportedOperatingSystem,
 )
@@ -52,6 +56,10 @@ class GetFloatReturn(NamedTuple):
     error: int
 
 
+WritableBuffer = Union[bytearray, memoryview, "array[float]", mmap.mmap]
+"""A writable, contiguous buffer that stored values can be written into."""
+
+
 class StoredValueInfo(NamedTuple):
     """Information about a stored value.
 
@@ -79,6 +87,14 @@ class TrnsysLib:
         """
         raise NotImplementedError
 
+    def get_stored_values_count(self) -> int:
+        """Return the number of stored values in this simulation.
+
+        Returns:
+            int: The number of stored values.
+        """
+        return len(self.get_stored_values_info())
+
     def step_forward(self, steps: int) -> StepForwardReturn:
         """Step the simulation forward.
 
@@ -101,6 +117,32 @@ class TrnsysLib:
         """
         raise NotImplementedError
 
+    def step_forward_into(
+        self, steps: int, buffer: WritableBuffer
+    ) -> StepForwardReturn:
+        """Step the simulation forward and write stored values into a buffer.
+
+        The stored values are written as float64 values to the start of
+        `buffer`, which is not modified if an error occurs.  Subclasses should
+        override this to avoid creating an intermediate list of values.
+
+        Args:
+            steps (int): The number of steps to take.
+            buffer (WritableBuffer): Where the stored values are written.
+
+        Returns:
+            StepForwardReturn
+
+        Raises:
+            ValueError: If `buffer` is read-only or too small to hold the stored
+                values.
+        """
+        target = _as_doubles(buffer, self.get_stored_values_count())
+        (values, done, error) = self.step_forward_with_values(steps)
+        if not error:
+            target[:] = array("d", values)
+        return StepForwardReturn(done, error)
+
     def get_current_time(self) -> float:
         """Return the current time of the simulation.
 
@@ -219,10 +261,17 @@ class LoadedTrnsysLib(TrnsysLib):
         if json_string is None:
             return []
 
-        stored_values_info: List[StoredValueInfo] = json.loads(
-            json_string.decode("utf-8")
-        )
-        return stored_values_info
+        return [
+            _stored_value_info(item) for item in json.loads(json_string.decode("utf-8"))
+        ]
+
+    def get_stored_values_count(self) -> int:
+        """Return the number of stored values in this simulation.
+
+        Refer to the documentation of `TrnsysLib.get_stored_values_count` for
+        more details.
+        """
+        return len(self.stored_values_buffer)
 
     def step_forward(self, steps: int) -> StepForwardReturn:
         """Step the simulation forward.
@@ -246,6 +295,28 @@ class LoadedTrnsysLib(TrnsysLib):
         values = list(self.stored_values_buffer)
         return StepForwardWithValuesReturn(values, done, error.value)
 
+    def step_forward_into(
+        self, steps: int, buffer: WritableBuffer
+    ) -> StepForwardReturn:
+        """Step the simulation forward and write stored values into a buffer.
+
+        Refer to the documentation of `TrnsysLib.step_forward_into` for more
+        details.
+        """
+        count = len(self.stored_values_buffer)
+        target = _as_doubles(buffer, count)
+        error = ct.c_int(0)
+        done = self.lib.apiStepForwardWithValues(
+            steps, self.stored_values_buffer, error
+        )
+        if not error.value:
+            ct.memmove(
+                (ct.c_double * count).from_buffer(target),
+                self.stored_values_buffer,
+                ct.sizeof(self.stored_values_buffer),
+            )
+        return StepForwardReturn(done, error.value)
+
     def get_current_time(self) -> float:
         """Return the current time of the simulation.
 
@@ -272,7 +343,7 @@ class LoadedTrnsysLib(TrnsysLib):
 
         Refer to the documentation of `TrnsysLib.get_time_step` for more details.
         """
-        return int(self.lib.apiGetTimeStep())
+        return float(self.lib.apiGetTimeStep())
 
     def get_current_step(self) -> int:
         """Return the current step of the simulation.
@@ -307,6 +378,118 @@ class LoadedTrnsysLib(TrnsysLib):
         return error.value
 
 
+class ThreadBoundTrnsysLib(TrnsysLib):
+    """Wraps a TRNSYS library so that it can only be used by one thread.
+
+    TRNSYS keeps its simulation state in the library itself, and the stored
+    values buffer is shared between calls, so using a library from several
+    threads at once corrupts both.  Every call made through this wrapper
+    first checks that it comes from the owner thread.
+    """
+
+    def __init__(self, lib: TrnsysLib, owner: Optional[int] = None):
+        """Initialize a ThreadBoundTrnsysLib object.
+
+        Args:
+            lib (TrnsysLib): The library to wrap.
+            owner (int, optional): The identifier of the owner thread, as
+                returned by `threading.get_ident`.  Defaults to the current thread.
+        """
+        self.lib = lib
+        self.owner = threading.get_ident() if owner is None else owner
+
+    def _check_thread(self) -> None:
+        """Raise an error if not called from the owner thread.
+
+        Raises:
+            ThreadAffinityError: If the calling thread is not the owner.
+        """
+        if threading.get_ident() != self.owner:
+            raise ThreadAffinityError(
+                f"This simulation is owned by thread {self.owner} but was used "
+                f"by thread {threading.get_ident()}"
+            )
+
+    def get_stored_values_info(self) -> List[StoredValueInfo]:
+        """Return information about the stored values in this simulation."""
+        self._check_thread()
+        return self.lib.get_stored_values_info()
+
+    def get_stored_values_count(self) -> int:
+        """Return the number of stored values in this simulation."""
+        self._check_thread()
+        return self.lib.get_stored_values_count()
+
+    def step_forward(self, steps: int) -> StepForwardReturn:
+        """Step the simulation forward."""
+        self._check_thread()
+        return self.lib.step_forward(steps)
+
+    def step_forward_with_values(self, steps: int) -> StepForwardWithValuesReturn:
+        """Step the simulation forward and return stored values."""
+        self._check_thread()
+        return self.lib.step_forward_with_values(steps)
+
+    def step_forward_into(
+        self, steps: int, buffer: WritableBuffer
+    ) -> StepForwardReturn:
+        """Step the simulation forward and write stored values into a buffer."""
+        self._check_thread()
+        return self.lib.step_forward_into(steps, buffer)
+
+    def get_current_time(self) -> float:
+        """Return the current time of the simulation."""
+        self._check_thread()
+        return self.lib.get_current_time()
+
+    def get_start_time(self) -> float:
+        """Return the start time of the simulation."""
+        self._check_thread()
+        return self.lib.get_start_time()
+
+    def get_stop_time(self) -> float:
+        """Return the stop time of the simulation."""
+        self._check_thread()
+        return self.lib.get_stop_time()
+
+    def get_time_step(self) -> float:
+        """Return the time step of the simulation."""
+        self._check_thread()
+        return self.lib.get_time_step()
+
+    def get_current_step(self) -> int:
+        """Return the current step of the simulation."""
+        self._check_thread()
+        return self.lib.get_current_step()
+
+    def get_total_steps(self) -> int:
+        """Return the total number of steps in the simulation."""
+        self._check_thread()
+        return self.lib.get_total_steps()
+
+    def get_output_value(self, unit: int, output_number: int) -> GetFloatReturn:
+        """Return the output value of a unit."""
+        self._check_thread()
+        return self.lib.get_output_value(unit, output_number)
+
+    def set_input_value(self, unit: int, input_number: int, value: float) -> int:
+        """Set an input value for a unit."""
+        self._check_thread()
+        return self.lib.set_input_value(unit, input_number, value)
+
+
+def _stored_value_info(item: Union[Dict[str, str], List[str]]) -> StoredValueInfo:
+    """Convert a stored value reported by TRNSYS to a `StoredValueInfo`.
+
+    TRNSYS reports each stored value as either an object with `id` and
+    `label` keys or an `[id, label]` array.
+    """
+    if isinstance(item, dict):
+        return StoredValueInfo(str(item["id"]), str(item["label"]))
+    (value_id, label) = item
+    return StoredValueInfo(str(value_id), str(label))
+
+
 def _load_api_lib(trnsys_dir: Path) -> ct.CDLL:
     """Load the TRNSYS API library.
 
@@ -367,6 +550,20 @@ def _load_api_lib(trnsys_dir: Path) -> ct.CDLL:
     return lib
 
 
+def _as_doubles(buffer: WritableBuffer, count: int) -> "memoryview[float]":
+    """Return a view of the first `count` float64 values in a buffer.
+
+    Raises:
+        ValueError: If `buffer` is read-only or too small to hold `count` values.
+    """
+    view = memoryview(buffer).cast("B")
+    if view.readonly:
+        raise ValueError("Buffer must be writable.")
+    if view.nbytes < count * ct.sizeof(ct.c_double):
+        raise ValueError(f"Buffer is too small to hold {count} stored values.")
+    return view[: count * ct.sizeof(ct.c_double)].cast("d")
+
+
 def _lib_filename(name: str) -> str:
     """Return the system-specific filename for a dynamic library.
 
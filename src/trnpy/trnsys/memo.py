@@ -0,0 +1,324 @@
+"""Code related to memoizing TRNSYS simulations."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union, cast
+
+from .simulation import Simulation, StepForwardWithValuesReturn
+
+CacheEntry = Dict[str, Any]
+
+_INDEX_FILENAME = "index.txt"
+
+
+class StepCache:
+    """A bounded LRU cache of simulation results with optional disk spill.
+
+    Entries are keyed by the history of a `MemoizedSimulation`.  When more
+    than `max_entries` are held in memory, the least recently used entry is
+    dropped, or queued for `spill_dir` if one was provided.  Queued entries
+    are written together, `segment_size` at a time, into a single segment
+    file, and an index of spilled keys is kept in memory (and appended to an
+    index file in `spill_dir`), so looking up an uncached key never touches
+    the disk.  Spilled entries are loaded back into memory the next time they
+    are requested, and consecutive lookups within one segment, such as when
+    replaying a run, read its file only once.
+
+    Entries still waiting to be spilled are only written when the cache is
+    flushed or closed, so a cache with a `spill_dir` should be closed when it
+    is no longer needed.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 100_000,
+        spill_dir: Optional[Union[str, Path]] = None,
+        *,
+        segment_size: int = 1024,
+    ):
+        """Initialize a StepCache object.
+
+        Entries already spilled to `spill_dir`, e.g., by a cache in another
+        process, are available to this cache.
+
+        Args:
+            max_entries (int, optional): The maximum number of entries held in
+                memory, not counting up to `segment_size` entries waiting to be
+                spilled.  Defaults to 100,000.
+            spill_dir (optional): Directory for entries evicted from memory.
+                Created if needed.  If not provided, evicted entries are lost.
+            segment_size (int, optional): The number of entries written to each
+                segment file.  Defaults to 1,024.
+
+        Raises:
+            ValueError: If `max_entries` or `segment_size` is less than 1.
+        """
+        if max_entries < 1:
+            raise ValueError("Maximum number of entries cannot be less than 1.")
+        if segment_size < 1:
+            raise ValueError("Segment size cannot be less than 1.")
+
+        self.max_entries = max_entries
+        self.segment_size = segment_size
+        self.spill_dir = None if spill_dir is None else Path(spill_dir)
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._unspilled: Dict[str, CacheEntry] = {}
+        self._spilled: Dict[str, str] = {}  # key -> segment file name
+        self._segment: Tuple[str, Dict[str, CacheEntry]] = ("", {})
+        if self.spill_dir is not None:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            index = self.spill_dir / _INDEX_FILENAME
+            if index.exists():
+                for line in index.read_text().splitlines():
+                    parts = line.split()
+                    # Skip lines torn by a process that crashed mid-write
+                    if len(parts) == 2 and parts[1].endswith(".json"):
+                        self._spilled[parts[0]] = parts[1]
+
+    def __enter__(self) -> StepCache:
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        """Exit the runtime context, closing the cache."""
+        self.close()
+
+    def __len__(self) -> int:
+        """Return the number of entries held in memory."""
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return the entry for `key`, or None if it is not cached."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+
+        entry = self._unspilled.pop(key, None)
+        if entry is None:
+            segment = self._spilled.get(key)
+            if segment is None:
+                return None
+            entry = self._read_segment(segment)[key]
+        self._insert(key, entry)
+        return entry
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        """Add or replace the entry for `key`."""
+        self._insert(key, entry)
+
+    def flush(self) -> None:
+        """Write every entry not yet in `spill_dir` to segment files.
+
+        This makes the entries available to caches created afterwards that
+        share the same `spill_dir`, such as those in other processes.
+        """
+        if self.spill_dir is None:
+            return
+        entries = list(self._unspilled.items())
+        entries += [
+            (key, entry)
+            for (key, entry) in self._entries.items()
+            if key not in self._spilled
+        ]
+        self._unspilled = {}
+        for start in range(0, len(entries), self.segment_size):
+            self._write_segment(dict(entries[start : start + self.segment_size]))
+
+    def close(self) -> None:
+        """Write every entry not yet in `spill_dir` to segment files.
+
+        The cache can still be used afterwards.  Refer to the documentation of
+        `StepCache.flush` for more details.
+        """
+        self.flush()
+
+    def _insert(self, key: str, entry: CacheEntry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            (evicted_key, evicted) = self._entries.popitem(last=False)
+            if self.spill_dir is None or evicted_key in self._spilled:
+                continue
+            self._unspilled[evicted_key] = evicted
+            if len(self._unspilled) >= self.segment_size:
+                self._write_segment(self._unspilled)
+                self._unspilled = {}
+
+    def _write_segment(self, entries: Dict[str, CacheEntry]) -> None:
+        """Write entries to a new segment file and record them in the index."""
+        assert self.spill_dir is not None
+        segment = f"{uuid.uuid4().hex}.json"
+        (self.spill_dir / segment).write_text(json.dumps(entries))
+        # A single append keeps lines from concurrent writers from interleaving
+        lines = "".join(f"{key} {segment}\n" for key in entries).encode()
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+        fd = os.open(self.spill_dir / _INDEX_FILENAME, flags, 0o644)
+        try:
+            os.write(fd, lines)
+        finally:
+            os.close(fd)
+        for key in entries:
+            self._spilled[key] = segment
+
+    def _read_segment(self, segment: str) -> Dict[str, CacheEntry]:
+        """Return the entries in a segment file, reusing the last one read."""
+        assert self.spill_dir is not None
+        if self._segment[0] != segment:
+            entries = json.loads((self.spill_dir / segment).read_text())
+            self._segment = (segment, cast(Dict[str, CacheEntry], entries))
+        return self._segment[1]
+
+
+class MemoizedSimulation:
+    """A simulation that reuses cached results for previously seen histories.
+
+    Every input change and step is folded into a key that fingerprints the
+    state of the simulation.  Stepping forward from a state that has been
+    seen before returns the cached stored values without running TRNSYS.
+    The underlying simulation is only created, and the uncached history
+    replayed into it, the first time a result is not in the cache.
+
+    Because calls are replayed lazily, an invalid unit or input number passed
+    to `set_input_value` is reported by the first call that misses the cache.
+
+    Usage example:
+        factory = functools.partial(Simulation.new, trnsys_dir, input_file)
+        with StepCache(spill_dir="path/to/cache") as cache:
+            sim = MemoizedSimulation(
+                factory, cache, fingerprint=deck_hash, quantum=1e-6
+            )
+            sim.set_input_value(unit=7, input_number=1, value=candidate)
+            done = False
+            while not done:
+                (values, done) = sim.step_forward_with_values()
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Simulation],
+        cache: StepCache,
+        *,
+        fingerprint: str,
+        quantum: Optional[float] = None,
+    ):
+        """Initialize a MemoizedSimulation object.
+
+        Args:
+            factory: Creates the underlying simulation when it is first needed.
+            cache: The cache of results, which may be shared between simulations.
+            fingerprint: Identifies the initial state of the simulation, e.g., a
+                hash of the deck contents.  Simulations sharing a cache must only
+                share a fingerprint if they are interchangeable.
+            quantum (float, optional): If provided, input values are rounded to
+                the nearest multiple of `quantum` before being used, so inputs
+                that differ by less than this share cached results.
+
+        Raises:
+            ValueError: If `quantum` is not positive.
+        """
+        if quantum is not None and quantum <= 0:
+            raise ValueError("Quantum must be positive.")
+
+        self._factory = factory
+        self._cache = cache
+        self._quantum = quantum
+        self._key = _chain_key("", fingerprint)
+        self._sim: Optional[Simulation] = None
+        self._pending: List[Callable[[Simulation], object]] = []
+
+    @property
+    def is_materialized(self) -> bool:
+        """True if the underlying simulation has been created."""
+        return self._sim is not None
+
+    def materialize(self) -> Simulation:
+        """Return the underlying simulation, brought up to date with all calls.
+
+        Errors raised by the factory or by replaying deferred calls propagate
+        to the caller.
+        """
+        if self._sim is None:
+            self._sim = self._factory()
+        (pending, self._pending) = (self._pending, [])
+        for call in pending:
+            call(self._sim)
+        return self._sim
+
+    def set_input_value(self, *, unit: int, input_number: int, value: float) -> None:
+        """Set an input value for a unit.
+
+        The call is deferred until the underlying simulation is needed.
+
+        Args:
+            unit (int): The unit of interest.
+            input_number (int): The input of interest.
+            value (float): The input is set to this value, after quantization.
+        """
+        (token, value) = self._quantize(value)
+        self._key = _chain_key(self._key, f"i:{unit}:{input_number}:{token}")
+        self._pending.append(
+            lambda sim: sim.set_input_value(
+                unit=unit, input_number=input_number, value=value
+            )
+        )
+
+    def step_forward(self, steps: int = 1) -> bool:
+        """Step the simulation forward.
+
+        Refer to the documentation of `Simulation.step_forward` for more details.
+        """
+        return self.step_forward_with_values(steps).done
+
+    def step_forward_with_values(self, steps: int = 1) -> StepForwardWithValuesReturn:
+        """Step the simulation forward and return stored values.
+
+        Refer to the documentation of `Simulation.step_forward_with_values`
+        for more details.
+        """
+        if steps < 1:
+            raise ValueError("Number of steps cannot be less than 1.")
+
+        key = _chain_key(self._key, f"s:{steps}")
+        entry = self._cache.get(key)
+        if entry is None:
+            (values, done) = self.materialize().step_forward_with_values(steps)
+            entry = {"values": values, "done": done}
+            self._cache.put(key, entry)
+        else:
+            self._pending.append(lambda sim: sim.step_forward(steps))
+        self._key = key
+        return StepForwardWithValuesReturn(list(entry["values"]), entry["done"])
+
+    def get_output_value(self, *, unit: int, output_number: int) -> float:
+        """Return the current output value of a unit.
+
+        Refer to the documentation of `Simulation.get_output_value` for more details.
+        """
+        key = _chain_key(self._key, f"o:{unit}:{output_number}")
+        entry = self._cache.get(key)
+        if entry is None:
+            value = self.materialize().get_output_value(
+                unit=unit, output_number=output_number
+            )
+            entry = {"value": value}
+            self._cache.put(key, entry)
+        return float(entry["value"])
+
+    def _quantize(self, value: float) -> Tuple[str, float]:
+        """Return the cache token and quantized value for an input value."""
+        if self._quantum is None:
+            return (float(value).hex(), value)
+        multiple = round(value / self._quantum)
+        return (str(multiple), multiple * self._quantum)
+
+
+def _chain_key(key: str, token: str) -> str:
+    """Return the key reached by applying `token` to the history at `key`."""
+    return hashlib.sha256(f"{key}|{token}".encode()).hexdigest()
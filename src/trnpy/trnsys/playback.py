@@ -0,0 +1,179 @@
+"""Code related to playing back input time series into a simulation."""
+
+from __future__ import annotations
+
+import math
+from array import array
+from typing import List, Mapping, Sequence, Tuple
+
+from ..exceptions import TrnsysSetInputValueError
+from .lib import WritableBuffer
+from .simulation import Simulation
+
+_TIME_TOLERANCE = 1e-9  # fraction of a time step
+
+
+class InputPlayback:
+    """Plays back input time series into a simulation as it steps forward.
+
+    Each series is bound to a `(unit, input_number)` target and resampled
+    once, when the playback is created, onto the time grid of the
+    simulation.  Before each step, the inputs are set to their values at the
+    time the step advances to, so stepping does not require any lookups or
+    interpolation.
+
+    A series can be any sequence of floats indexed by sample, such as a list,
+    an `array.array`, a memoryview, or a column of a NumPy array or memmap.
+    Only the samples needed for the simulation's time grid are read.
+
+    Usage example:
+        prices = numpy.load("prices.npy", mmap_mode="r")
+        playback = InputPlayback(
+            sim,
+            {(7, 1): prices[:, 0], (7, 2): prices[:, 1]},
+            start_time=0,
+            time_step=1,
+        )
+        done = False
+        while not done:
+            done = playback.step_forward()
+    """
+
+    def __init__(
+        self,
+        sim: Simulation,
+        series: Mapping[Tuple[int, int], Sequence[float]],
+        *,
+        start_time: float,
+        time_step: float,
+        interpolate: bool = True,
+    ):
+        """Initialize an InputPlayback object.
+
+        Args:
+            sim: The simulation to play inputs back into.
+            series: The time series for each `(unit, input_number)` target.
+            start_time: The simulation time of the first sample of each series.
+            time_step: The simulation time between samples.
+            interpolate (bool, optional): If True, values between samples are
+                linearly interpolated.  Otherwise, the previous sample is held.
+                Defaults to True.  Values outside a series hold its first or
+                last sample.
+
+        Raises:
+            ValueError: If `time_step` is not positive or a series is empty.
+        """
+        if time_step <= 0:
+            raise ValueError("Time step must be positive.")
+
+        self.sim = sim
+        self.targets: List[Tuple[int, int]] = list(series)
+        sim_start = sim.start_time
+        sim_step = sim.time_step
+        steps = round((sim.stop_time - sim_start) / sim_step)
+        times = [sim_start + (i + 1) * sim_step for i in range(steps)]
+
+        columns = [
+            _resample(values, start_time, time_step, times, interpolate)
+            for values in series.values()
+        ]
+        self._rows = array("d", [value for row in zip(*columns) for value in row])
+        self._step = round((sim.current_time - sim_start) / sim_step)
+        self._steps = steps
+
+    def apply(self) -> None:
+        """Set the inputs to their values for the next step.
+
+        This is called by `InputPlayback.step_forward` and only needs to be
+        called directly when the simulation is stepped forward some other way,
+        in which case `InputPlayback.advance` must be called after each step.
+
+        Raises:
+            TrnsysSetInputValueError
+        """
+        count = len(self.targets)
+        offset = max(0, min(self._step, self._steps - 1)) * count
+        set_input_value = self.sim.lib.set_input_value
+        for (unit, input_number), value in zip(
+            self.targets, self._rows[offset : offset + count]
+        ):
+            error_code = set_input_value(unit, input_number, value)
+            if error_code:
+                raise TrnsysSetInputValueError(error_code)
+
+    def advance(self, steps: int = 1) -> None:
+        """Record that the simulation has stepped forward without playback.
+
+        Args:
+            steps (int, optional): The number of steps taken.  Defaults to 1.
+        """
+        self._step += steps
+
+    def step_forward(self, steps: int = 1) -> bool:
+        """Set the inputs and step the simulation forward, one step at a time.
+
+        Refer to the documentation of `Simulation.step_forward` for more details.
+        """
+        if steps < 1:
+            raise ValueError("Number of steps cannot be less than 1.")
+
+        done = False
+        for _ in range(steps):
+            self.apply()
+            done = self.sim.step_forward()
+            self._step += 1
+            if done:
+                break
+        return done
+
+    def step_forward_into(self, buffer: WritableBuffer, steps: int = 1) -> bool:
+        """Set the inputs and step forward, writing stored values into a buffer.
+
+        The simulation is stepped forward one step at a time, so `buffer`
+        holds the stored values after the last step taken.  Refer to the
+        documentation of `Simulation.step_forward_into` for more details.
+        """
+        if steps < 1:
+            raise ValueError("Number of steps cannot be less than 1.")
+
+        done = False
+        for _ in range(steps):
+            self.apply()
+            done = self.sim.step_forward_into(buffer)
+            self._step += 1
+            if done:
+                break
+        return done
+
+
+def _resample(
+    values: Sequence[float],
+    start_time: float,
+    time_step: float,
+    times: Sequence[float],
+    interpolate: bool,
+) -> List[float]:
+    """Return the value of a regularly sampled series at each time.
+
+    Raises:
+        ValueError: If `values` is empty.
+    """
+    last = len(values) - 1
+    if last < 0:
+        raise ValueError("Input series cannot be empty.")
+
+    resampled = []
+    for time in times:
+        position = (time - start_time) / time_step
+        index = math.floor(position + _TIME_TOLERANCE)
+        if index < 0:
+            resampled.append(float(values[0]))
+        elif index >= last:
+            resampled.append(float(values[last]))
+        else:
+            fraction = max(0.0, position - index)
+            value = float(values[index])
+            if interpolate and fraction > _TIME_TOLERANCE:
+                value += (float(values[index + 1]) - value) * fraction
+            resampled.append(value)
+    return resampled
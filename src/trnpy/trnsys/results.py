@@ -0,0 +1,336 @@
+"""Code related to storing and reading simulation results."""
+
+from __future__ import annotations
+
+import json
+import math
+import mmap
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Sequence, Union
+
+from .lib import StoredValueInfo
+from .simulation import Simulation
+
+_META_FILENAME = "meta.json"
+_FORMAT_VERSION = 1
+_DOUBLE = struct.Struct("d")
+_TIME_TOLERANCE = 1e-9  # fraction of a time step
+
+
+class ResultsWriter:
+    """Writes stored values to a columnar results directory.
+
+    Each stored value is written to its own file of contiguous float64 values,
+    one value per row, next to a `meta.json` file that describes the columns.
+    Rows are assumed to be one time step apart, so the time of any row can be
+    derived from the time of the first row and the time step.
+
+    Usage example:
+        sim = Simulation.new(trnsys_dir, input_file)
+        with ResultsWriter.create("path/to/results", sim) as writer:
+            done = False
+            while not done:
+                done = writer.step_forward(sim)
+    """
+
+    @classmethod
+    def create(cls, directory: Union[str, Path], sim: Simulation) -> ResultsWriter:
+        """Create a writer for the stored values of a simulation.
+
+        The first row written is expected to hold the stored values after
+        the next step of `sim` is taken.
+
+        Args:
+            directory: Path to the results directory.  Created if needed.
+            sim: The simulation whose stored values will be written.
+        """
+        time_step = sim.time_step
+        return cls(
+            directory,
+            sim.stored_values_info,
+            start_time=sim.current_time + time_step,
+            time_step=time_step,
+        )
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        stored_values_info: Sequence[StoredValueInfo],
+        *,
+        start_time: float,
+        time_step: float,
+    ):
+        """Initialize a ResultsWriter object.
+
+        Any results previously written to `directory` are overwritten.
+
+        Args:
+            directory: Path to the results directory.  Created if needed.
+            stored_values_info: Information about the stored values, in the
+                order they will be appended.
+            start_time: The simulation time of the first row.
+            time_step: The simulation time between rows.
+
+        Raises:
+            ValueError: If `time_step` is not positive.
+        """
+        if time_step <= 0:
+            raise ValueError("Time step must be positive.")
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        columns = [
+            {"id": info.id, "label": info.label, "file": f"{index}.f64"}
+            for index, info in enumerate(stored_values_info)
+        ]
+        meta = {
+            "version": _FORMAT_VERSION,
+            "byteorder": sys.byteorder,
+            "start_time": start_time,
+            "time_step": time_step,
+            "columns": columns,
+        }
+        (self.directory / _META_FILENAME).write_text(json.dumps(meta, indent=2))
+        self._files: List[BinaryIO] = [
+            open(self.directory / str(column["file"]), "wb") for column in columns
+        ]
+        self._row = array("d", bytes(_DOUBLE.size * len(columns)))
+
+    def __enter__(self) -> ResultsWriter:
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        """Exit the runtime context, closing the writer."""
+        self.close()
+
+    def append(self, values: Sequence[float]) -> None:
+        """Append a row of stored values.
+
+        Args:
+            values: One value for each stored value, in order.
+
+        Raises:
+            ValueError: If the number of values does not match the number of columns.
+        """
+        if len(values) != len(self._files):
+            raise ValueError(
+                f"Expected {len(self._files)} values but received {len(values)}."
+            )
+        pack = _DOUBLE.pack
+        for file, value in zip(self._files, values):
+            file.write(pack(value))
+
+    def step_forward(self, sim: Simulation, steps: int = 1) -> bool:
+        """Step a simulation forward, appending a row after each step.
+
+        Args:
+            sim: The simulation to step forward.
+            steps (int, optional): The number of steps to take.  Defaults to 1.
+
+        Returns:
+            - True if final time has been reached as a result of stepping forward.
+            - False if more steps can be taken.
+
+        Raises:
+            ValueError: If `steps` is less than 1.
+            TrnsysStepForwardError: If a simulation error occurs while stepping forward.
+        """
+        if steps < 1:
+            raise ValueError("Number of steps cannot be less than 1.")
+
+        done = False
+        for _ in range(steps):
+            done = sim.step_forward_into(self._row)
+            self.append(self._row)
+            if done:
+                break
+        return done
+
+    def flush(self) -> None:
+        """Flush buffered rows to disk."""
+        for file in self._files:
+            file.flush()
+
+    def close(self) -> None:
+        """Flush buffered rows to disk and close the column files."""
+        for file in self._files:
+            file.close()
+
+
+class Results:
+    """A read-only view of a columnar results directory.
+
+    Column files are memory-mapped, so opening results and querying a time
+    range does not read any values from disk until they are accessed.  The
+    returned columns are `memoryview` objects of float64 values that can be
+    indexed directly or wrapped without copying (e.g., `numpy.asarray`).
+
+    Views returned by `Results.column` stay valid after the results are
+    closed.  Each column file is unmapped once its last view is released.
+
+    Usage example:
+        with Results.open("path/to/results") as results:
+            view = results.column("some_id", start_time=3600, stop_time=4320)
+            peak = max(view)
+    """
+
+    @classmethod
+    def open(cls, directory: Union[str, Path]) -> Results:
+        """Open a results directory written by `ResultsWriter`.
+
+        Args:
+            directory: Path to the results directory.
+
+        Raises:
+            FileNotFoundError: If the directory or any of its files do not exist.
+            ValueError: If the results were written in an incompatible format.
+        """
+        return cls(directory)
+
+    def __init__(self, directory: Union[str, Path]):
+        """Initialize a Results object.
+
+        Refer to the documentation of `Results.open` for more details.
+        """
+        self.directory = Path(directory)
+        meta = json.loads((self.directory / _META_FILENAME).read_text())
+        if meta.get("version") != _FORMAT_VERSION:
+            raise ValueError(f"Unsupported results version: {meta.get('version')}")
+        if meta.get("byteorder") != sys.byteorder:
+            raise ValueError(f"Results were written as {meta.get('byteorder')}-endian")
+
+        self.start_time: float = meta["start_time"]
+        self.time_step: float = meta["time_step"]
+        columns = meta["columns"]
+        self.stored_values_info = [
+            StoredValueInfo(column["id"], column["label"]) for column in columns
+        ]
+        self._indices: Dict[str, int] = {
+            info.id: index for (index, info) in enumerate(self.stored_values_info)
+        }
+
+        paths = [self.directory / column["file"] for column in columns]
+        sizes = [path.stat().st_size for path in paths]
+        # A run that stopped mid-row may leave columns of unequal length
+        self.rows = min(sizes) // _DOUBLE.size if sizes else 0
+
+        self._closed = False
+        self._maps: List[mmap.mmap] = []
+        self._views: List[memoryview[float]] = []
+        for path in paths:
+            if self.rows == 0:
+                self._views.append(memoryview(b"").cast("d"))
+                continue
+            with open(path, "rb") as file:
+                mapped = mmap.mmap(
+                    file.fileno(), self.rows * _DOUBLE.size, access=mmap.ACCESS_READ
+                )
+            self._maps.append(mapped)
+            self._views.append(memoryview(mapped).cast("d"))
+
+    def __enter__(self) -> Results:
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        """Exit the runtime context, closing the results."""
+        self.close()
+
+    def __len__(self) -> int:
+        """Return the number of rows."""
+        return self.rows
+
+    def close(self) -> None:
+        """Release the memory-mapped column files.
+
+        Calling this more than once has no effect.
+        """
+        self._closed = True
+        for view in self._views:
+            view.release()
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # unmapped when the last view returned by `column` is released
+        self._views = []
+        self._maps = []
+
+    def time_at(self, row: int) -> float:
+        """Return the simulation time of a row.
+
+        Args:
+            row (int): The row of interest.
+        """
+        return self.start_time + row * self.time_step
+
+    def rows_between(
+        self, start_time: Optional[float] = None, stop_time: Optional[float] = None
+    ) -> slice:
+        """Return the rows with times between `start_time` and `stop_time`.
+
+        Both bounds are inclusive.  A missing bound extends the range to the
+        first or last row.
+
+        Args:
+            start_time (float, optional): The earliest time of interest.
+            stop_time (float, optional): The latest time of interest.
+
+        Returns:
+            slice: The range of rows, clamped to the rows that exist.
+        """
+        start = 0
+        stop = self.rows
+        if start_time is not None:
+            offset = (start_time - self.start_time) / self.time_step
+            start = max(start, math.ceil(offset - _TIME_TOLERANCE))
+        if stop_time is not None:
+            offset = (stop_time - self.start_time) / self.time_step
+            stop = min(stop, math.floor(offset + _TIME_TOLERANCE) + 1)
+        return slice(start, max(start, stop))
+
+    def times(
+        self, start_time: Optional[float] = None, stop_time: Optional[float] = None
+    ) -> List[float]:
+        """Return the time of each row between `start_time` and `stop_time`.
+
+        Refer to the documentation of `Results.rows_between` for details on
+        how the bounds are applied.
+        """
+        rows = self.rows_between(start_time, stop_time)
+        return [self.time_at(row) for row in range(rows.start, rows.stop)]
+
+    def column(
+        self,
+        key: Union[int, str],
+        start_time: Optional[float] = None,
+        stop_time: Optional[float] = None,
+    ) -> memoryview[float]:
+        """Return the values of a stored value between two times.
+
+        Refer to the documentation of `Results.rows_between` for details on
+        how the bounds are applied.
+
+        Args:
+            key: The index or `id` of the stored value.
+            start_time (float, optional): The earliest time of interest.
+            stop_time (float, optional): The latest time of interest.
+
+        Returns:
+            memoryview: A read-only view of float64 values backed by the file.
+
+        Raises:
+            KeyError: If no stored value matches `key`.
+            ValueError: If the results have been closed.
+        """
+        if self._closed:
+            raise ValueError("The results have been closed.")
+        index = key if isinstance(key, int) else self._indices[key]
+        if not 0 <= index < len(self._views):
+            raise KeyError(key)
+        return self._views[index][self.rows_between(start_time, stop_time)]
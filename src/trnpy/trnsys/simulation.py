@@ -10,7 +10,13 @@ from ..exceptions import (
     TrnsysSetInputValueError,
     TrnsysStepForwardError,
 )
-from .lib import LoadedTrnsysLib, StoredValueInfo, TrnsysLib
+from .lib import (
+    LoadedTrnsysLib,
+    StoredValueInfo,
+    ThreadBoundTrnsysLib,
+    TrnsysLib,
+    WritableBuffer,
+)
 
 
 class Simulation:
@@ -65,6 +71,17 @@ class Simulation:
         """Initialize a Simulation object."""
         self.lib = lib
 
+    def bind_to_current_thread(self) -> None:
+        """Only allow this simulation to be used by the current thread.
+
+        After binding, using the simulation from any other thread raises a
+        `ThreadAffinityError` instead of corrupting its state.  Simulations
+        that are not bound do not pay for this check.  To share a simulation
+        between threads, use a `SimulationDispatcher` instead.
+        """
+        lib = self.lib.lib if isinstance(self.lib, ThreadBoundTrnsysLib) else self.lib
+        self.lib = ThreadBoundTrnsysLib(lib)
+
     def step_forward(self, steps: int = 1) -> bool:
         """Step the simulation forward.
 
@@ -119,6 +136,41 @@ class Simulation:
 
         return StepForwardWithValuesReturn(values, done)
 
+    def step_forward_into(self, buffer: WritableBuffer, steps: int = 1) -> bool:
+        """Step the simulation forward and write stored values into a buffer.
+
+        This avoids creating a list of values on every step.  The stored
+        values are written as float64 values to the start of `buffer`, which
+        can be any writable, contiguous buffer such as an `array.array("d")`,
+        a `bytearray`, an `mmap`, or a `memoryview` slice of one.
+
+        Usage example:
+            row = array.array("d", bytes(8 * sim.stored_values_count))
+            done = False
+            while not done:
+                done = sim.step_forward_into(row)
+
+        Args:
+            buffer (WritableBuffer): Where the stored values are written.
+            steps (int, optional): The number of steps to take.  Defaults to 1.
+
+        Returns:
+            - True if final time has been reached as a result of stepping forward.
+            - False if more steps can be taken.
+
+        Raises:
+            ValueError: If `steps` is less than 1 or `buffer` is read-only or too small.
+            TrnsysStepForwardError: If a simulation error occurs while stepping forward.
+        """
+        if steps < 1:
+            raise ValueError("Number of steps cannot be less than 1.")
+
+        (done, error_code) = self.lib.step_forward_into(steps, buffer)
+        if error_code:
+            raise TrnsysStepForwardError(error_code)
+
+        return done
+
     def get_output_value(self, *, unit: int, output_number: int) -> float:
         """Return the current output value of a unit.
 
@@ -163,6 +215,11 @@ class Simulation:
         """
         return self.lib.get_stored_values_info()
 
+    @property
+    def stored_values_count(self) -> int:
+        """The number of stored values in this simulation."""
+        return self.lib.get_stored_values_count()
+
     @property
     def current_time(self) -> float:
         """The current time of the simulation."""
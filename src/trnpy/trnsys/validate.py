@@ -0,0 +1,264 @@
+"""Code related to validating TRNSYS decks without running them."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import multiprocessing
+import os
+from collections import deque
+from multiprocessing.connection import Connection, wait
+from multiprocessing.context import BaseContext
+from multiprocessing.process import BaseProcess
+from pathlib import Path
+from typing import Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from ..exceptions import TrnsysError, TrnsysInitializeSimulationError
+from .lib import LoadedTrnsysLib, StoredValueInfo, _lib_filename, _stored_value_info
+
+_CACHE_VERSION = 1
+
+
+class DeckValidation(NamedTuple):
+    """The result of validating a deck.
+
+    Attributes:
+        input_file (Path): The deck that was validated.
+        error_type (Optional[str]): The name of the exception raised when
+            initializing the deck, "WorkerExited" if the worker process exited
+            without reporting a result, or None if the deck is valid.
+        error_code (Optional[int]): The TRNSYS error code, with 0 indicating
+            success, or the worker's exit code for "WorkerExited".  None for
+            other errors.
+        message (Optional[str]): A description of the error, if one occurred.
+        stored_values_info (List[StoredValueInfo]): The stored values of the
+            deck.  Empty if an error occurred.
+    """
+
+    input_file: Path
+    error_type: Optional[str]
+    error_code: Optional[int]
+    message: Optional[str]
+    stored_values_info: List[StoredValueInfo]
+
+
+_Outcome = Tuple[Optional[str], Optional[int], Optional[str], List[StoredValueInfo]]
+
+
+class DeckValidator:
+    """Validates TRNSYS decks using worker processes.
+
+    Validating a deck initializes it in a worker process to find out whether
+    a `TrnsysInitializeSimulationError` is raised and which stored values it
+    defines.  Because a TRNSYS library can only be initialized once per
+    process, each deck is validated by a fresh worker.  A worker that crashes
+    or exits while initializing its deck is recorded as a failed validation
+    and does not affect the other decks.
+
+    Results are cached by a hash of the deck contents and of the size and
+    modification time of the libs in the TRNSYS directory and the user Type
+    libs, so unchanged decks are never validated twice.  Files referenced by a
+    deck are not part of the hash.  Only outcomes reported by TRNSYS are
+    cached; decks whose validation failed for another reason, such as a
+    crashed worker, are validated again on the next call.
+
+    Usage example:
+        with DeckValidator(trnsys_dir, cache_file="validation.json") as validator:
+            for result in validator.validate(deck_files):
+                if result.error_type is not None:
+                    print(f"{result.input_file}: {result.message}")
+    """
+
+    def __init__(
+        self,
+        trnsys_dir: Union[str, Path],
+        user_type_libs: Optional[List[Union[str, Path]]] = None,
+        *,
+        processes: Optional[int] = None,
+        cache_file: Optional[Union[str, Path]] = None,
+        mp_context: Optional[BaseContext] = None,
+    ):
+        """Initialize a DeckValidator object.
+
+        Args:
+            trnsys_dir: Path to the TRNSYS directory.  Must exist.
+            user_type_libs: Optional list of paths to user Type libs.  All must exist.
+            processes (int, optional): The maximum number of decks validated at
+                once.  Defaults to the number of CPUs.
+            cache_file (optional): Path to a JSON file used to persist cached
+                results between validators.  Created if needed.
+            mp_context (optional): The multiprocessing context used to start
+                workers.  Defaults to the "spawn" context, so that workers do
+                not inherit libraries loaded by this process.
+
+        Raises:
+            FileNotFoundError: If any provided path does not exist.
+            ValueError: If `processes` is less than 1.
+        """
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if processes < 1:
+            raise ValueError("Number of processes cannot be less than 1.")
+
+        self.trnsys_dir = Path(trnsys_dir).resolve(strict=True)
+        self.user_type_libs = [
+            Path(lib_file).resolve(strict=True) for lib_file in user_type_libs or []
+        ]
+        self.processes = processes
+        self.cache_file = None if cache_file is None else Path(cache_file)
+        self._context = mp_context or multiprocessing.get_context("spawn")
+        self._cache: Dict[str, _Outcome] = {}
+        if self.cache_file is not None and self.cache_file.exists():
+            cached = json.loads(self.cache_file.read_text())
+            # Caches written in another format are discarded and rewritten
+            if cached.get("version") == _CACHE_VERSION:
+                for key, (error_type, code, message, info) in cached["results"].items():
+                    self._cache[key] = (
+                        error_type,
+                        code,
+                        message,
+                        [_stored_value_info(x) for x in info],
+                    )
+
+    def __enter__(self) -> DeckValidator:
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        """Exit the runtime context, closing the validator."""
+        self.close()
+
+    def close(self) -> None:
+        """Close the validator.
+
+        Workers only run during `DeckValidator.validate`, so there is nothing
+        left to shut down, but this is kept so that validators can be used as
+        context managers.
+        """
+
+    def validate(self, input_files: Iterable[Union[str, Path]]) -> List[DeckValidation]:
+        """Validate decks, using cached results where possible.
+
+        Args:
+            input_files: Paths to the decks to validate.  All must exist.
+
+        Returns:
+            List[DeckValidation]: One result per deck, in the order provided.
+
+        Raises:
+            FileNotFoundError: If any deck or lib does not exist.
+        """
+        paths = [Path(input_file).resolve(strict=True) for input_file in input_files]
+        libs_digest = self._libs_digest()
+        keys = [_deck_key(path, libs_digest) for path in paths]
+
+        uncached = {key: path for (key, path) in zip(keys, paths)}
+        for key in self._cache.keys() & uncached.keys():
+            del uncached[key]
+        outcomes = self._run_workers(uncached)
+        cacheable = (None, TrnsysInitializeSimulationError.__name__)
+        for key, outcome in outcomes.items():
+            if outcome[0] in cacheable:
+                self._cache[key] = outcome
+        if outcomes:
+            self._save_cache()
+
+        return [
+            DeckValidation(
+                path, *(outcomes[key] if key in outcomes else self._cache[key])
+            )
+            for (key, path) in zip(keys, paths)
+        ]
+
+    def _run_workers(self, decks: Dict[str, Path]) -> Dict[str, _Outcome]:
+        """Validate each deck in its own worker process, keyed like `decks`."""
+        pending: Deque[Tuple[str, Path]] = deque(decks.items())
+        running: Dict[Connection, Tuple[str, BaseProcess]] = {}
+        outcomes: Dict[str, _Outcome] = {}
+        try:
+            while pending or running:
+                while pending and len(running) < self.processes:
+                    (key, path) = pending.popleft()
+                    (parent_conn, child_conn) = self._context.Pipe(duplex=False)
+                    process = self._context.Process(  # type: ignore[attr-defined]
+                        target=_validate_deck,
+                        args=(child_conn, self.trnsys_dir, path, self.user_type_libs),
+                        daemon=True,
+                    )
+                    process.start()
+                    child_conn.close()
+                    running[parent_conn] = (key, process)
+
+                for conn in wait(list(running)):
+                    assert isinstance(conn, Connection)
+                    (key, process) = running.pop(conn)
+                    outcomes[key] = _receive_outcome(conn, process)
+        finally:
+            for conn, (_, process) in running.items():
+                process.terminate()
+                process.join()
+                conn.close()
+        return outcomes
+
+    def _libs_digest(self) -> bytes:
+        """Return a digest of the size and modification time of every lib."""
+        suffix = Path(_lib_filename("trnsys")).suffix
+        lib_files = sorted(self.trnsys_dir.glob(f"*{suffix}"))
+        digest = hashlib.sha256()
+        for path in [*lib_files, *self.user_type_libs]:
+            stat = path.stat()
+            digest.update(f"{path}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+        return digest.digest()
+
+    def _save_cache(self) -> None:
+        """Write the cached results to `cache_file`, if one was provided."""
+        if self.cache_file is not None:
+            results = {
+                key: (error_type, code, message, [info._asdict() for info in infos])
+                for (key, (error_type, code, message, infos)) in self._cache.items()
+            }
+            cached = {"version": _CACHE_VERSION, "results": results}
+            self.cache_file.write_text(json.dumps(cached))
+
+
+def _deck_key(input_file: Path, libs_digest: bytes) -> str:
+    """Return the cache key for a deck."""
+    digest = hashlib.sha256(input_file.read_bytes())
+    digest.update(libs_digest)
+    return digest.hexdigest()
+
+
+def _receive_outcome(conn: Connection, process: BaseProcess) -> _Outcome:
+    """Receive the outcome of a validation and wait for its worker to exit."""
+    try:
+        outcome: _Outcome = conn.recv()
+    except EOFError:
+        process.join()
+        outcome = (
+            "WorkerExited",
+            process.exitcode,
+            f"The worker process exited unexpectedly ({process.exitcode}).",
+            [],
+        )
+    process.join()
+    conn.close()
+    return outcome
+
+
+def _validate_deck(
+    conn: Connection, trnsys_dir: Path, input_file: Path, user_type_libs: List[Path]
+) -> None:
+    """Initialize a deck and send the outcome.
+
+    This runs in a worker process, which must not be reused afterwards.
+    """
+    try:
+        lib = LoadedTrnsysLib(trnsys_dir, input_file, user_type_libs)
+        outcome: _Outcome = (None, 0, None, lib.get_stored_values_info())
+    except Exception as err:
+        error_code = err.error_code if isinstance(err, TrnsysError) else None
+        outcome = (type(err).__name__, error_code, str(err), [])
+    try:
+        conn.send(outcome)
+    finally:
+        conn.close()
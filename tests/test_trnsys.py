@@ -1,5 +1,16 @@
+import ctypes as ct
+import functools
+import json
 import math
+import multiprocessing
+import os
+import pickle
+import signal
+import threading
+import time
+from array import array
 from dataclasses import dataclass, field
+from multiprocessing.shared_memory import SharedMemory
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
@@ -7,17 +18,30 @@ import pytest
 
 from trnpy.exceptions import (
     DuplicateLibraryError,
+    SimulationError,
+    ThreadAffinityError,
     TrnsysGetOutputValueError,
+    TrnsysInitializeSimulationError,
     TrnsysSetInputValueError,
     TrnsysStepForwardError,
 )
+from trnpy.trnsys.batch import BatchJob, JobFailure, run_batch
+from trnpy.trnsys.dispatch import SimulationDispatcher
+from trnpy.trnsys.ensemble import Ensemble
 from trnpy.trnsys.lib import (
     GetFloatReturn,
+    LoadedTrnsysLib,
     StepForwardReturn,
+    StepForwardWithValuesReturn,
+    StoredValueInfo,
     TrnsysLib,
     track_lib_path,
 )
+from trnpy.trnsys.memo import MemoizedSimulation, StepCache
+from trnpy.trnsys.playback import InputPlayback
+from trnpy.trnsys.results import Results, ResultsWriter
 from trnpy.trnsys.simulation import Simulation
+from trnpy.trnsys.validate import DeckValidation, DeckValidator
 
 
 @dataclass(frozen=True)
@@ -46,6 +70,7 @@ class MockTrnsysLib(TrnsysLib):
         time_step: float = 1,
         current_time: float = 0,
         units: Optional[Dict[int, UnitState]] = None,
+        stored_values: Optional[List[StoredValueInfo]] = None,
     ):
         """Create a new mocked TRNSYS library.
 
@@ -56,12 +81,15 @@ class MockTrnsysLib(TrnsysLib):
             current_time (float, optional): The current simulation time.  Defaults to 0.
             units (dict, optional): The assumed state of any units in the
                 simualation, keyed by unit number.
+            stored_values (list, optional): The stored values in the simulation.
+                After each step, stored value `i` is `(i + 1) * current_time`.
         """
         self._start_time = start_time
         self._final_time = final_time
         self._time_step = time_step
         self._current_time = current_time
         self._units = units if units else {}
+        self._stored_values = stored_values if stored_values else []
 
     def _is_at_final_time(self):
         """Check if simulation is at final time.
@@ -77,6 +105,34 @@ class MockTrnsysLib(TrnsysLib):
             return StepForwardReturn(False, 1)
         return StepForwardReturn(True, 0)
 
+    def step_forward_with_values(self, steps: int) -> StepForwardWithValuesReturn:
+        if self._is_at_final_time():
+            return StepForwardWithValuesReturn([], False, 1)
+        for _ in range(steps):
+            self._current_time += self._time_step
+            if self._is_at_final_time():
+                break
+        values = [(i + 1) * self._current_time for i in range(len(self._stored_values))]
+        return StepForwardWithValuesReturn(values, self._is_at_final_time(), 0)
+
+    def get_stored_values_info(self) -> List[StoredValueInfo]:
+        return list(self._stored_values)
+
+    def get_current_time(self) -> float:
+        return self._current_time
+
+    def get_start_time(self) -> float:
+        return self._start_time
+
+    def get_stop_time(self) -> float:
+        return self._final_time
+
+    def get_time_step(self) -> float:
+        return self._time_step
+
+    def get_current_step(self) -> int:
+        return round((self._current_time - self._start_time) / self._time_step)
+
     def get_output_value(self, unit: int, output_number: int) -> GetFloatReturn:
         if unit not in self._units:
             return GetFloatReturn(math.nan, 1)
@@ -158,3 +214,556 @@ def test_setting_input_values():
 
     # Unit and input number now available
     sim = new_sim(lib_state={"units": {23: UnitState(inputs=[1, 2, 3])}})
+
+
+def test_results_round_trip_and_time_slicing(tmp_path):
+    stored_values = [StoredValueInfo("a", "Tank"), StoredValueInfo("b", "Load")]
+    sim = new_sim(lib_state={"stored_values": stored_values, "final_time": 10})
+    with ResultsWriter.create(tmp_path, sim) as writer:
+        assert not writer.step_forward(sim, 4)
+        assert writer.step_forward(sim, 100)  # stops at final time
+
+    with Results.open(tmp_path) as results:
+        assert len(results) == 10
+        assert results.stored_values_info == stored_values
+        assert results.times(3.5, 6) == [4, 5, 6]
+        view = results.column("b", start_time=3.5, stop_time=6)
+        assert view.tolist() == [8, 10, 12]
+        column = results.column(0)
+        assert column.tolist() == [float(t) for t in range(1, 11)]
+        assert len(results.column(0, start_time=20)) == 0
+        with pytest.raises(KeyError):
+            results.column("missing")
+
+    # Views outlive the results, which can be closed again safely
+    assert view.tolist() == [8, 10, 12]
+    assert column[-1] == 10
+    results.close()
+    with pytest.raises(ValueError):
+        results.column(0)
+
+
+def test_memoized_simulation_reuses_cached_steps(tmp_path):
+    created = []
+
+    def factory():
+        created.append(new_sim(lib_state={"units": {7: UnitState(inputs=[0])}}))
+        return created[-1]
+
+    def run(cache, value):
+        sim = MemoizedSimulation(factory, cache, fingerprint="deck", quantum=0.01)
+        sim.set_input_value(unit=7, input_number=1, value=value)
+        return [sim.step_forward_with_values(2) for _ in range(3)]
+
+    cache = StepCache(max_entries=2, spill_dir=tmp_path, segment_size=1)
+    first = run(cache, 1.0)
+    assert len(created) == 1
+    assert created[0].lib._units[7].inputs == [1.0]
+
+    # A near-duplicate input is served from memory and the spill directory
+    assert run(cache, 1.001) == first
+    assert len(created) == 1
+
+    # A different input requires a new simulation
+    run(cache, 1.1)
+    assert len(created) == 2
+    assert created[1].lib._units[7].inputs == [pytest.approx(1.1)]
+
+
+def test_step_cache_spills_segments_and_indexes_keys(tmp_path, monkeypatch):
+    cache = StepCache(max_entries=2, spill_dir=tmp_path, segment_size=3)
+    for i in range(8):
+        cache.put(str(i), {"value": i})
+    # Six entries were evicted, which fills two segments
+    assert sorted(path.suffix for path in tmp_path.iterdir()) == [
+        ".json",
+        ".json",
+        ".txt",
+    ]
+
+    reads = []
+    read_segment = cache._read_segment
+    monkeypatch.setattr(
+        cache, "_read_segment", lambda name: reads.append(name) or read_segment(name)
+    )
+    assert cache.get("missing") is None
+    assert reads == []  # misses never touch the disk
+    assert [cache.get(str(i)) for i in range(3)] == [{"value": i} for i in range(3)]
+    assert len(set(reads)) == 1
+
+    # Entries are flushed on close and available to a new cache sharing the
+    # directory, even if another writer left a torn line in the index
+    with cache:
+        cache.put("8", {"value": 8})
+    with open(tmp_path / "index.txt", "a") as index:
+        index.write("deadbeef")
+    cache = StepCache(max_entries=2, spill_dir=tmp_path)
+    assert [cache.get(str(i)) for i in range(9)] == [{"value": i} for i in range(9)]
+    assert cache.get("deadbeef") is None
+
+
+def test_memoized_simulation_replays_deferred_calls_on_cache_miss():
+    cache = StepCache()
+    lib_state = {"units": {7: UnitState(inputs=[0], outputs=[3])}}
+    sim = MemoizedSimulation(
+        lambda: new_sim(lib_state=lib_state), cache, fingerprint="deck"
+    )
+    sim.step_forward()
+    assert sim.is_materialized
+
+    sim = MemoizedSimulation(lambda: new_sim(), cache, fingerprint="deck")
+    sim.step_forward()
+    sim.set_input_value(unit=7, input_number=1, value=2)
+    assert not sim.is_materialized
+    with pytest.raises(TrnsysSetInputValueError):
+        sim.get_output_value(unit=7, output_number=1)
+
+
+requires_fork = pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(),
+    reason="mocks are only inherited by forked workers",
+)
+
+
+@requires_fork
+def test_deck_validator_reports_errors_and_caches_by_content(tmp_path, monkeypatch):
+    class FakeApi:
+        def __init__(self, reported):
+            self.reported = reported
+
+        def apiGetStoredValuesInfo(self):
+            return json.dumps(self.reported).encode()
+
+    class ValidatingLib(LoadedTrnsysLib):
+        def __init__(self, trnsys_dir, input_file, user_type_libs):
+            if "bad" in input_file.read_text():
+                raise TrnsysInitializeSimulationError(7)
+            self.lib = FakeApi([{"id": "1", "label": input_file.stem}])
+
+    monkeypatch.setattr("trnpy.trnsys.validate.LoadedTrnsysLib", ValidatingLib)
+    (tmp_path / "good.dck").write_text("good")
+    (tmp_path / "bad.dck").write_text("bad")
+    decks = [tmp_path / "good.dck", tmp_path / "bad.dck"]
+    cache_file = tmp_path / "cache.json"
+    type_lib = tmp_path / "types.dll"
+    type_lib.write_bytes(b"v1")
+
+    fork = multiprocessing.get_context("fork")
+    with DeckValidator(
+        tmp_path, [type_lib], cache_file=cache_file, mp_context=fork
+    ) as validator:
+        (good, bad) = validator.validate(decks)
+    assert (good.error_type, good.error_code, good.message) == (None, 0, None)
+    assert good.stored_values_info == [StoredValueInfo("1", "good")]
+    assert (bad.error_type, bad.error_code) == ("TrnsysInitializeSimulationError", 7)
+    assert bad.message == "a required Type was not found"
+    assert bad.stored_values_info == []
+
+    # Cached results are reused without starting any workers
+    monkeypatch.setattr(fork, "Process", None)
+    with DeckValidator(
+        tmp_path, [type_lib], cache_file=cache_file, mp_context=fork
+    ) as validator:
+        (cached_good, cached_bad) = validator.validate(decks)
+        assert (cached_good, cached_bad) == (good, bad)
+        assert all(
+            isinstance(x, StoredValueInfo) for x in cached_good.stored_values_info
+        )
+
+        # Rebuilding a user Type lib invalidates the cache, so workers are needed
+        type_lib.write_bytes(b"v2 is larger")
+        with pytest.raises(TypeError):
+            validator.validate(decks)
+
+
+@requires_fork
+def test_deck_validator_records_crashed_workers(tmp_path, monkeypatch):
+    class FakeApi:
+        def apiGetStoredValuesInfo(self):
+            return b"[]"
+
+    class CrashingLib(LoadedTrnsysLib):
+        def __init__(self, trnsys_dir, input_file, user_type_libs):
+            contents = input_file.read_text()
+            if contents == "exit":
+                os._exit(3)
+            if contents == "missing":
+                raise OSError("cannot load lib")
+            self.lib = FakeApi()
+
+    monkeypatch.setattr("trnpy.trnsys.validate.LoadedTrnsysLib", CrashingLib)
+    decks = []
+    for contents in ("exit", "missing", "good"):
+        (tmp_path / f"{contents}.dck").write_text(contents)
+        decks.append(tmp_path / f"{contents}.dck")
+    cache_file = tmp_path / "cache.json"
+
+    fork = multiprocessing.get_context("fork")
+    with DeckValidator(
+        tmp_path, processes=2, cache_file=cache_file, mp_context=fork
+    ) as validator:
+        (exited, missing, good) = validator.validate(decks)
+    assert exited == DeckValidation(
+        decks[0],
+        "WorkerExited",
+        3,
+        "The worker process exited unexpectedly (3).",
+        [],
+    )
+    assert missing == DeckValidation(decks[1], "OSError", None, "cannot load lib", [])
+    assert good == DeckValidation(decks[2], None, 0, None, [])
+
+    # Only the outcome reported by TRNSYS is cached
+    cached = json.loads(cache_file.read_text())["results"]
+    assert list(cached.values()) == [[None, 0, None, []]]
+
+
+def test_trnsys_errors_survive_pickling():
+    err = pickle.loads(pickle.dumps(TrnsysStepForwardError(1)))
+    assert isinstance(err, TrnsysStepForwardError)
+    assert err.error_code == 1
+    assert str(err) == "simulation has reached its final time"
+
+
+@requires_fork
+def test_ensemble_steps_members_in_lockstep():
+    stored_values = [StoredValueInfo("a", "Tank"), StoredValueInfo("b", "Load")]
+    factories = [
+        functools.partial(
+            new_sim,
+            lib_state={
+                "stored_values": stored_values,
+                "time_step": time_step,
+                "final_time": 4,
+                "units": {7: UnitState(inputs=[0, 0], outputs=[time_step])},
+            },
+        )
+        for time_step in (1, 2)
+    ]
+    fork = multiprocessing.get_context("fork")
+    with Ensemble(factories, mp_context=fork) as ensemble:
+        assert ensemble.stored_values_info == stored_values
+        (values, done) = ensemble.step_forward_with_values()
+        assert values.shape == (2, 2)
+        assert values.tolist() == [[1, 2], [2, 4]]
+        assert done == [False, False]
+        assert ensemble.step_forward() == [False, True]
+        assert ensemble.values.tolist() == [[2, 4], [4, 8]]
+
+        ensemble.set_input_values([(7, 1), (7, 2)], [[1, 2], [3, 4]])
+        with pytest.raises(ValueError):
+            ensemble.set_input_values([(7, 1)], [[1, 2], [3, 4]])
+        with pytest.raises(TrnsysSetInputValueError):
+            ensemble.set_input_values([(7, 3)], [[1], [3]])
+        assert ensemble.get_output_values(unit=7, output_number=1) == [1, 2]
+
+        with pytest.raises(TrnsysStepForwardError):
+            ensemble.step_forward()
+
+
+@requires_fork
+def test_run_batch_records_failures(tmp_path):
+    def crash():
+        os._exit(3)
+
+    stored_values = [StoredValueInfo("a", "Tank")]
+    jobs = [
+        BatchJob("ok", lambda: new_sim()),
+        BatchJob(
+            "results",
+            lambda: new_sim(lib_state={"stored_values": stored_values}),
+            results_dir=tmp_path / "results",
+        ),
+        BatchJob("late", lambda: new_sim(lib_state={"current_time": 10})),
+        BatchJob("crash", crash),
+    ]
+    fork = multiprocessing.get_context("fork")
+    result = run_batch(jobs, processes=2, mp_context=fork)
+    assert result.completed == ["ok", "results"]
+    assert result.failures[0] == JobFailure(
+        "late",
+        10,
+        10,
+        "TrnsysStepForwardError",
+        1,
+        "simulation has reached its final time",
+    )
+    assert result.failures[1][:5] == ("crash", None, None, "WorkerExited", 3)
+    assert (result.skipped, result.aborted) == ([], False)
+    with Results.open(tmp_path / "results") as results:
+        assert len(results) == 10
+
+
+@requires_fork
+def test_run_batch_aborts_after_repeated_failures():
+    jobs = [
+        BatchJob(str(i), lambda: new_sim(lib_state={"current_time": 10}))
+        for i in range(4)
+    ]
+    fork = multiprocessing.get_context("fork")
+    result = run_batch(jobs, processes=1, max_failures_per_code=2, mp_context=fork)
+    assert result.completed == []
+    assert [failure.job for failure in result.failures] == ["0", "1"]
+    assert result.skipped == ["2", "3"]
+    assert result.aborted
+
+
+def test_step_forward_into_writes_stored_values_to_buffers():
+    stored_values = [StoredValueInfo("a", "Tank"), StoredValueInfo("b", "Load")]
+    sim = new_sim(lib_state={"stored_values": stored_values})
+    assert sim.stored_values_count == 2
+
+    row = array("d", [0, 0, -1])
+    assert not sim.step_forward_into(row)
+    assert row.tolist() == [1, 2, -1]
+
+    raw = bytearray(16)
+    sim.step_forward_into(memoryview(raw), steps=2)
+    assert array("d", raw).tolist() == [3, 6]
+
+    with pytest.raises(ValueError):
+        sim.step_forward_into(bytearray(8))
+
+
+def test_loaded_lib_copies_stored_values_without_a_list():
+    class FakeApi:
+        def apiStepForwardWithValues(self, steps, values, error):
+            values[0] = 1.5
+            values[1] = 2.5
+            error.value = 0 if steps == 1 else 1
+            return False
+
+    lib = LoadedTrnsysLib.__new__(LoadedTrnsysLib)
+    lib.lib = FakeApi()
+    lib.stored_values_buffer = (ct.c_double * 2)()
+    sim = Simulation(lib)
+
+    row = array("d", [0, 0])
+    assert not sim.step_forward_into(row)
+    assert row.tolist() == [1.5, 2.5]
+
+    row = array("d", [0, 0])
+    with pytest.raises(TrnsysStepForwardError):
+        sim.step_forward_into(row, steps=2)
+    assert row.tolist() == [0, 0]  # not modified on error
+
+    # Read-only buffers are rejected before the simulation steps forward
+    steps = []
+    lib.lib.apiStepForwardWithValues = lambda *args: steps.append(args)
+    for buffer in (bytes(16), memoryview(bytearray(16)).toreadonly()):
+        with pytest.raises(ValueError):
+            sim.step_forward_into(buffer)
+    assert steps == []
+
+
+def test_input_playback_resamples_series_onto_simulation_grid():
+    stored_values = [StoredValueInfo("a", "Tank")]
+    inputs = [0.0, 0.0]
+    sim = new_sim(
+        lib_state={
+            "stored_values": stored_values,
+            "time_step": 0.5,
+            "final_time": 3,
+            "units": {7: UnitState(inputs=inputs)},
+        }
+    )
+    playback = InputPlayback(
+        sim,
+        {(7, 1): [10, 20, 30], (7, 2): array("d", [1, 2, 3])},
+        start_time=0,
+        time_step=1,
+    )
+    row = array("d", [0])
+    applied = []
+    done = False
+    while not done:
+        done = playback.step_forward_into(row)
+        applied.append(list(inputs))
+    assert applied == [
+        [15, 1.5],
+        [20, 2],
+        [25, 2.5],
+        [30, 3],
+        [30, 3],  # holds the last sample
+        [30, 3],
+    ]
+
+    sim = new_sim(
+        lib_state={
+            "stored_values": stored_values,
+            "units": {7: UnitState(inputs=inputs)},
+        }
+    )
+    playback = InputPlayback(sim, {(7, 1): [10, 20, 30]}, start_time=0, time_step=1)
+    assert playback.step_forward_into(row, 2) is False
+    assert (row[0], inputs[0]) == (2, 30)
+    assert sim.current_step == 2
+
+    sim = new_sim(lib_state={"units": {7: UnitState(inputs=inputs)}})
+    playback = InputPlayback(
+        sim, {(7, 1): [1, 2]}, start_time=0.5, time_step=1, interpolate=False
+    )
+    playback.apply()
+    assert inputs[0] == 1
+    playback.advance(2)
+    playback.apply()
+    assert inputs[0] == 2
+
+    playback = InputPlayback(sim, {(8, 1): [1]}, start_time=0, time_step=1)
+    with pytest.raises(TrnsysSetInputValueError):
+        playback.step_forward()
+
+
+def run_in_thread(fn):
+    """Call `fn` on a new thread and return its result or error."""
+    outcome = []
+
+    def target():
+        try:
+            outcome.append(fn())
+        except Exception as err:
+            outcome.append(err)
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    thread.join()
+    return outcome[0]
+
+
+def test_bound_simulation_rejects_other_threads():
+    sim = new_sim(lib_state={"units": {7: UnitState(inputs=[0], outputs=[3])}})
+    assert run_in_thread(lambda: sim.get_output_value(unit=7, output_number=1)) == 3
+    playback = InputPlayback(sim, {(7, 1): [1]}, start_time=0, time_step=1)
+
+    sim.bind_to_current_thread()
+    assert sim.get_output_value(unit=7, output_number=1) == 3
+    err = run_in_thread(lambda: sim.get_output_value(unit=7, output_number=1))
+    assert isinstance(err, ThreadAffinityError)
+    assert isinstance(run_in_thread(playback.apply), ThreadAffinityError)
+
+
+def test_dispatcher_runs_calls_on_the_owner_thread():
+    stored_values = [StoredValueInfo("a", "Tank")]
+    lib_state = {"stored_values": stored_values, "units": {7: UnitState(inputs=[0])}}
+    with SimulationDispatcher(lambda: new_sim(lib_state=lib_state)) as dispatcher:
+        assert dispatcher.step_forward_with_values(2).result() == ([2], False)
+        futures = [
+            run_in_thread(lambda: dispatcher.step_forward_with_values())
+            for _ in range(3)
+        ]
+        assert [future.result().values for future in futures] == [[3], [4], [5]]
+
+        dispatcher.set_input_value(unit=7, input_number=1, value=4).result()
+        with pytest.raises(TrnsysSetInputValueError):
+            dispatcher.set_input_value(unit=8, input_number=1, value=4).result()
+
+        sim = dispatcher.submit(lambda sim: sim).result()
+        with pytest.raises(ThreadAffinityError):
+            sim.current_time
+
+
+@pytest.mark.parametrize(
+    "reported",
+    [
+        [{"id": "1", "label": "Tank"}, {"id": "2", "label": "Load"}],
+        [["1", "Tank"], ["2", "Load"]],
+    ],
+)
+def test_loaded_lib_converts_stored_values_info(tmp_path, reported):
+    class FakeApi:
+        def apiGetStoredValuesInfo(self):
+            return json.dumps(reported).encode()
+
+        def apiGetCurrentTime(self):
+            return 0.0
+
+        def apiGetTimeStep(self):
+            return 1.0
+
+    lib = LoadedTrnsysLib.__new__(LoadedTrnsysLib)
+    lib.lib = FakeApi()
+    lib.stored_values_buffer = (ct.c_double * 2)()
+    sim = Simulation(lib)
+    expected = [StoredValueInfo("1", "Tank"), StoredValueInfo("2", "Load")]
+    assert sim.stored_values_info == expected
+
+    with ResultsWriter.create(tmp_path, sim) as writer:
+        writer.append([1, 2])
+    with Results.open(tmp_path) as results:
+        assert results.stored_values_info == expected
+
+
+def test_loaded_lib_reports_sub_hour_time_steps():
+    class FakeApi:
+        def apiGetStartTime(self):
+            return 0.0
+
+        def apiGetStopTime(self):
+            return 1.0
+
+        def apiGetCurrentTime(self):
+            return 0.0
+
+        def apiGetTimeStep(self):
+            return 0.25
+
+        def apiSetInputValue(self, unit, input_number, value, error):
+            error.value = 0
+
+    lib = LoadedTrnsysLib.__new__(LoadedTrnsysLib)
+    lib.lib = FakeApi()
+    sim = Simulation(lib)
+    assert sim.time_step == 0.25
+
+    playback = InputPlayback(sim, {(7, 1): [0, 4]}, start_time=0, time_step=1)
+    assert playback._rows.tolist() == [1, 2, 3, 4]
+
+
+@requires_fork
+def test_ensemble_reports_members_that_exit():
+    class CrashingLib(MockTrnsysLib):
+        def step_forward_with_values(self, steps):
+            os._exit(5)
+
+    stored_values = [StoredValueInfo("a", "Tank")]
+    factories = [
+        lambda: new_sim(lib_state={"stored_values": stored_values}),
+        lambda: Simulation(CrashingLib(stored_values=stored_values)),
+        lambda: new_sim(lib_state={"stored_values": stored_values}),
+    ]
+    fork = multiprocessing.get_context("fork")
+    with Ensemble(factories, mp_context=fork) as ensemble:
+        with pytest.raises(SimulationError, match="member 1 exited .*exit code 5"):
+            ensemble.step_forward()
+        with pytest.raises(SimulationError, match="broken"):
+            ensemble.step_forward()
+
+
+@requires_fork
+def test_ensemble_close_outlives_views_and_wedged_members(monkeypatch):
+    class WedgedLib(MockTrnsysLib):
+        def set_input_value(self, unit, input_number, value):
+            time.sleep(60)
+            return 0
+
+    stored_values = [StoredValueInfo("a", "Tank")]
+    factories = [
+        lambda: new_sim(lib_state={"stored_values": stored_values}),
+        lambda: Simulation(WedgedLib(stored_values=stored_values)),
+    ]
+    monkeypatch.setattr("trnpy.trnsys.ensemble._CLOSE_TIMEOUT", 0.1)
+    fork = multiprocessing.get_context("fork")
+    ensemble = Ensemble(factories, mp_context=fork)
+    ensemble.step_forward()
+    view = ensemble.values.cast("B")
+    name = ensemble._shm.name
+    ensemble._connections[1].send(("set_inputs", ([(7, 1)], [1.0])))
+    processes = list(ensemble._processes)
+
+    ensemble.close()
+    assert processes[0].exitcode == 0
+    assert processes[1].exitcode == -signal.SIGTERM
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(name=name)
+    assert view.cast("d").tolist() == [1, 1]
+    view.release()